@@ -6,24 +6,34 @@ Downloads DB from GitHub Releases. Manual update button in sidebar.
 import streamlit as st
 import sqlite3
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser as HTMLParser
 import re
 import os
-import json
+import orjson
 import time
 import gzip
-import shutil
-from difflib import SequenceMatcher
+import heapq
+from rapidfuzz import fuzz, process
 
 # --- Config ---
 DB_PATH = "dld_units.db"
-DB_GZ_PATH = "dld_units.db.gz"
+DB_META_PATH = DB_PATH + ".meta.json"  # ETag/Last-Modified of the asset the local DB came from
 
 # GitHub Release config — change these to your repo
 GITHUB_REPO = os.environ.get("GITHUB_REPO", "NABILNET-ORG/dld-unit-finder")
 GITHUB_RELEASE_TAG = "latest-data"
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")  # Only needed for private repos
 
+# Regular browser headers for the last-resort PF scrape
+PF_BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.google.com/",
+}
+
 # --- Page Config ---
 st.set_page_config(page_title="DLD Unit Finder 🏠", page_icon="🏠", layout="centered")
 
@@ -62,14 +72,41 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# ===================== HTTP =====================
+
+@st.cache_resource
+def get_http():
+    """Shared keep-alive session for GitHub — pooled TLS connections across reruns, retries transient errors."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], raise_on_status=False)
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+    return session
+
+
+@st.cache_resource
+def get_pf_http():
+    """
+    Keep-alive session for the PF scraper, with no retries: a 429/403 there is a bot block,
+    and try_scrape_pf should fall through to its next method at once, not back off or honour Retry-After.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0))
+    return session
+
+
 # ===================== DATABASE =====================
 
-def download_db_from_github(force=False):
-    """Download compressed DB from GitHub Releases, decompress it."""
+def download_db_from_github(force=False, progress=None):
+    """
+    Download compressed DB from GitHub Releases, decompress it. progress(fraction) is called as bytes arrive.
+    Returns "updated" when a new file was swapped in, "unchanged" when the local DB is already current, False on failure.
+    """
     if not force and os.path.exists(DB_PATH):
-        age_hours = (time.time() - os.path.getmtime(DB_PATH)) / 3600
+        # DB mtime = when the data arrived; checked_at = last time GitHub said it's unchanged
+        last_check = max(os.path.getmtime(DB_PATH), _read_db_meta().get("checked_at", 0))
+        age_hours = (time.time() - last_check) / 3600
         if age_hours < 24:
-            return True
+            return "unchanged"
 
     try:
         # Get release info
@@ -78,70 +115,139 @@ def download_db_from_github(force=False):
         if GITHUB_TOKEN:
             headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
 
-        resp = requests.get(api_url, headers=headers, timeout=15)
+        resp = get_http().get(api_url, headers=headers, timeout=15)
         if resp.status_code != 200:
             # Try direct URL for public repos
             direct_url = f"https://github.com/{GITHUB_REPO}/releases/download/{GITHUB_RELEASE_TAG}/dld_units.db.gz"
-            return _download_and_decompress(direct_url, {})
+            return _download_and_decompress(direct_url, {}, progress)
         
-        release = resp.json()
+        release = orjson.loads(resp.content)
         
         # Find the .db.gz asset
-        asset_url = None
-        for asset in release.get("assets", []):
-            if asset["name"] == "dld_units.db.gz":
-                asset_url = asset["browser_download_url"]
-                break
-        
-        if not asset_url:
+        asset = next((a for a in release.get("assets", []) if a["name"] == "dld_units.db.gz"), None)
+        if not asset:
             return False
 
+        # Same asset revision as the local DB — nothing to fetch, just restart the 24h window
+        updated_at = asset.get("updated_at")
+        if updated_at and _read_db_meta().get("asset_updated_at") == updated_at and _local_db_intact():
+            _mark_checked()
+            return "unchanged"
+
         dl_headers = {}
         if GITHUB_TOKEN:
             dl_headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
 
-        return _download_and_decompress(asset_url, dl_headers)
+        status = _download_and_decompress(asset["browser_download_url"], dl_headers, progress)
+        if status == "updated":
+            _write_db_meta({**_read_db_meta(), "asset_updated_at": updated_at})
+        return status
 
     except Exception as e:
         st.warning(f"Download error: {e}")
         return False
 
 
-def _download_and_decompress(url, headers):
-    """Download .gz file and decompress to .db"""
+def _read_db_meta() -> dict:
     try:
-        resp = requests.get(url, headers=headers, stream=True, timeout=300)
-        if resp.status_code != 200:
-            return False
+        with open(DB_META_PATH, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return {}
 
-        # Save compressed
-        with open(DB_GZ_PATH, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
-                f.write(chunk)
 
-        # Decompress
-        with gzip.open(DB_GZ_PATH, "rb") as f_in:
-            with open(DB_PATH, "wb") as f_out:
-                shutil.copyfileobj(f_in, f_out)
+def _write_db_meta(meta: dict):
+    with open(DB_META_PATH, "wb") as f:
+        f.write(orjson.dumps(meta))
 
-        # Cleanup .gz
-        os.remove(DB_GZ_PATH)
 
-        # Validate it's a real SQLite file
-        with open(DB_PATH, "rb") as f:
-            header = f.read(16)
-        if b"SQLite" not in header:
-            os.remove(DB_PATH)
-            return False
+def _mark_checked():
+    """Restart the 24h freshness window without touching the DB file — its mtime keys the caches and the sidebar date."""
+    _write_db_meta({**_read_db_meta(), "checked_at": time.time()})
+
 
+def _local_db_intact() -> bool:
+    """
+    The sidecar describes the local DB only if the file is the one we swapped in (same mtime/size)
+    and still opens with a readable units table — a damaged or hand-replaced DB gets re-downloaded.
+    """
+    meta = _read_db_meta()
+    try:
+        st_db = os.stat(DB_PATH)
+        if meta.get("db_mtime") != st_db.st_mtime or meta.get("db_size") != st_db.st_size:
+            return False
+        check = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+        try:
+            check.execute("SELECT 1 FROM units LIMIT 1").fetchall()
+        finally:
+            check.close()
         return True
+    except (OSError, sqlite3.Error):
+        return False
+
+
+def _download_and_decompress(url, headers, progress=None):
+    """Stream the .gz asset through gunzip into a temp file, validate, then swap it in as the .db"""
+    tmp_path = DB_PATH + ".tmp"
+    try:
+        # Raw bytes only — the asset is already gzip, so no transfer-encoding layer on top
+        headers = {**headers, "Accept-Encoding": "identity"}
+
+        # Conditional GET — an unchanged asset answers 304 with no body
+        meta = _read_db_meta()
+        if meta.get("url") == url and _local_db_intact():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        # Context manager hands the pooled connection back on every exit — non-200, bad magic, truncated gzip
+        with get_http().get(url, headers=headers, stream=True, timeout=300) as resp:
+            if resp.status_code == 304:
+                _mark_checked()
+                return "unchanged"
+            if resp.status_code != 200:
+                return False
+
+            # Inflate while downloading — the payload is the .gz file itself
+            resp.raw.decode_content = False
+            total = int(resp.headers.get("Content-Length") or 0)
+            with gzip.GzipFile(fileobj=resp.raw, mode="rb") as f_in:
+                # Check the exact 16-byte SQLite magic on the first inflated block — bail before writing anything else
+                chunk = f_in.read(4 * 1024 * 1024)
+                if chunk[:16] != b"SQLite format 3\x00":
+                    return False
+                with open(tmp_path, "wb") as f_out:
+                    while chunk:
+                        f_out.write(chunk)
+                        if progress and total:
+                            progress(min(resp.raw.tell() / total, 1.0))  # compressed bytes off the wire
+                        chunk = f_in.read(4 * 1024 * 1024)
+
+        # Validate the units table is readable
+        check = sqlite3.connect(f"file:{tmp_path}?mode=ro&immutable=1", uri=True)  # no -wal/-shm side files
+        try:
+            check.execute("SELECT 1 FROM units LIMIT 1").fetchall()
+        finally:
+            check.close()
+
+        # Atomic swap — open (mmap'd) connections keep reading the old inode until get_db.clear()
+        os.replace(tmp_path, DB_PATH)
+        st_db = os.stat(DB_PATH)
+        _write_db_meta({
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "db_mtime": st_db.st_mtime,
+            "db_size": st_db.st_size,
+        })
+        return "updated"
     except Exception:
-        for p in [DB_GZ_PATH, DB_PATH]:
-            if os.path.exists(p):
-                try:
-                    os.remove(p)
-                except:
-                    pass
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except:
+                pass
         return False
 
 
@@ -149,25 +255,31 @@ def _download_and_decompress(url, headers):
 def get_db():
     if not os.path.exists(DB_PATH):
         return None
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # Read-only: the app never writes, so SQLite skips write locks entirely
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA cache_size = -65536")       # 64 MB page cache — B-tree pages stay hot across searches
+    conn.execute("PRAGMA mmap_size = 1073741824")    # map up to 1 GB (SQLite clamps to its build max) — file-backed, no read() per page
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA query_only = ON")
     return conn
 
 
-def get_db_stats():
-    if not os.path.exists(DB_PATH):
-        return None
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_db_stats(db_mtime: float, db_size: int):
+    """Sidebar stats off the shared connection, keyed on the DB file's mtime/size so they refresh only when it changes."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM units")
-        rows = c.fetchone()[0]
-        c.execute("PRAGMA table_info(units)")
-        cols = len(c.fetchall())
-        conn.close()
-        size = os.path.getsize(DB_PATH) / (1024 * 1024)
-        mod = time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(DB_PATH)))
-        return {"rows": rows, "columns": cols, "size_mb": round(size, 1), "updated": mod}
+        conn = get_db()
+        if conn is None:
+            return None
+        try:
+            rows = int(conn.execute("SELECT value FROM db_meta WHERE key = 'row_count'").fetchone()[0])
+        except (sqlite3.OperationalError, TypeError):
+            # DB built before db_meta existed — count the slow way
+            rows = conn.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+        cols = len(conn.execute("PRAGMA table_info(units)").fetchall())
+        mod = time.strftime("%Y-%m-%d %H:%M", time.localtime(db_mtime))
+        return {"rows": rows, "columns": cols, "size_mb": round(db_size / (1024 * 1024), 1), "updated": mod}
     except:
         return None
 
@@ -182,6 +294,15 @@ PF_AREA_WORDS = {
     "silicon", "oasis", "investment", "international",
 }
 
+# Scrape / phrase regexes — compiled once instead of per call
+RE_BEDROOMS = re.compile(r"(\d+)\s*(?:Bed(?:room)?s?|BR)\b", re.I)
+RE_SQFT = re.compile(r"([\d,]+(?:\.\d+)?)\s*(?:sqft|sq\.?\s*ft)\b", re.I)
+RE_ZONE = re.compile(r"Zone\s*name\s*[:\s]*([A-Za-z][A-Za-z\s\d]+)")
+RE_REFERENCE = re.compile(r"Reference\s*[:\s]*([A-Za-z0-9\-]+)")
+RE_ADDRESS = re.compile(r"([\w\s]+(?:,\s*[\w\s]+){2,3},\s*Dubai)")
+RE_PF_TITLE_SUFFIX = re.compile(r"\s*\|\s*Property Finder.*$")
+RE_TITLE_SPLIT = re.compile(r"[\s,\-/|]+")
+
 def parse_pf_url(url: str) -> dict:
     """
     Parse Property Finder URL with smart project name extraction.
@@ -239,13 +360,20 @@ def parse_pf_url(url: str) -> dict:
     return data
 
 
+class ScrapeBlocked(Exception):
+    """Every scrape method failed — raised (not returned) so st.cache_data never stores it."""
+
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
 def try_scrape_pf(url: str) -> dict:
     """
     Try to scrape PF page using multiple strategies to bypass bot detection.
     Order: social bot UAs → cloudscraper → Google Cache → regular request.
+    Only successful parses are cached; a blocked fetch raises ScrapeBlocked and is retried next time.
     """
     extra = {}
     html = ""
+    http = get_pf_http()
     
     # === Strategy 1: Social bot user agents ===
     # PF MUST whitelist these for link previews (WhatsApp, Facebook, etc.)
@@ -258,7 +386,7 @@ def try_scrape_pf(url: str) -> dict:
     ]
     for ua in social_uas:
         try:
-            resp = requests.get(url, headers={"User-Agent": ua}, timeout=15, allow_redirects=True)
+            resp = http.get(url, headers={"User-Agent": ua}, timeout=15, allow_redirects=True)
             if resp.status_code == 200 and len(resp.text) > 5000 and "javascript" not in resp.text[:500].lower():
                 html = resp.text
                 extra["_scrape_method"] = ua.split("/")[0]
@@ -286,7 +414,7 @@ def try_scrape_pf(url: str) -> dict:
     if not html:
         try:
             cache_url = f"https://webcache.googleusercontent.com/search?q=cache:{url}&strip=1"
-            resp = requests.get(cache_url, headers={
+            resp = http.get(cache_url, headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
             }, timeout=15)
             if resp.status_code == 200 and len(resp.text) > 5000:
@@ -298,12 +426,7 @@ def try_scrape_pf(url: str) -> dict:
     # === Strategy 4: Regular browser request ===
     if not html:
         try:
-            resp = requests.get(url, headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://www.google.com/",
-            }, timeout=15, allow_redirects=True)
+            resp = http.get(url, headers=PF_BROWSER_HEADERS, timeout=15, allow_redirects=True)
             if resp.status_code == 200 and len(resp.text) > 5000 and "javascript" not in resp.text[:500].lower():
                 html = resp.text
                 extra["_scrape_method"] = "regular"
@@ -312,52 +435,100 @@ def try_scrape_pf(url: str) -> dict:
     
     # === No HTML? Give up. ===
     if not html:
-        extra["_scrape_status"] = "blocked"
-        return extra
+        raise ScrapeBlocked(url)
     
     # === Parse the HTML ===
     extra["_scrape_status"] = "ok"
     extra["_html_length"] = len(html)
     
-    soup = BeautifulSoup(html, "html.parser")
-    text = soup.get_text(" ", strip=True)
+    tree = HTMLParser(html)
+    
+    # One selector pass over the DOM — dispatch by tag instead of re-walking per element type
+    h1 = None
+    og_desc = ""
+    ld_blocks = []
+    crumb_texts = []
+    for node in tree.css('h1, meta, a, script[type="application/ld+json"]'):
+        tag = node.tag
+        if tag == "a":
+            # Breadcrumbs
+            href = node.attributes.get("href") or ""
+            txt = node.text(strip=True)
+            if txt and ("for-sale" in href or "for-rent" in href) and len(txt) > 2:
+                if txt not in crumb_texts:
+                    crumb_texts.append(txt)
+        elif tag == "meta":
+            # og:title
+            attrs = node.attributes
+            content = (attrs.get("content") or "").strip()
+            prop_name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if "og:title" in prop_name and content:
+                extra["og_title"] = RE_PF_TITLE_SUFFIX.sub("", content)
+            elif prop_name == "og:description" and content:
+                og_desc = content
+        elif tag == "h1":
+            if h1 is None:
+                h1 = node
+        else:
+            ld_blocks.append(node.text())
     
     # Title
-    h1 = soup.find("h1")
-    if h1:
-        t = h1.get_text(strip=True)
+    if h1 is not None:
+        t = h1.text(strip=True)
         if "javascript" not in t.lower():
             extra["title"] = t
     
-    # og:title
-    for meta in soup.find_all("meta"):
-        content = meta.get("content", "").strip()
-        prop_name = (meta.get("name") or meta.get("property") or "").lower()
-        if "og:title" in prop_name and content:
-            extra["og_title"] = re.sub(r"\s*\|\s*Property Finder.*$", "", content)
+    if crumb_texts:
+        extra["breadcrumbs"] = crumb_texts
     
-    # Bedrooms
-    m = re.search(r"(\d+)\s*(?:Bed(?:room)?s?|BR)\b", text, re.I)
-    if m:
-        extra["bedrooms"] = int(m.group(1))
+    # JSON-LD — structured bedrooms/size take precedence over text matches
+    for block in ld_blocks:
+        try:
+            ld = orjson.loads(block)
+            items = ld if isinstance(ld, list) else [ld]
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                if "numberOfRooms" in item and "bedrooms" not in extra:
+                    extra["bedrooms"] = int(item["numberOfRooms"])
+                if "floorSize" in item and isinstance(item["floorSize"], dict):
+                    val = item["floorSize"].get("value")
+                    if val and "area_sqft" not in extra:
+                        extra["area_sqft"] = float(str(val).replace(",", ""))
+        except (ValueError, TypeError):  # orjson.JSONDecodeError is a ValueError
+            continue
+        if "bedrooms" in extra and "area_sqft" in extra:
+            break  # remaining blocks are breadcrumb/organization metadata
     
-    # Area sqft
-    m = re.search(r"([\d,]+(?:\.\d+)?)\s*(?:sqft|sq\.?\s*ft)\b", text, re.I)
-    if m:
-        extra["area_sqft"] = float(m.group(1).replace(",", ""))
+    # Visible text of the listing body only — header/nav/footer menus are skipped,
+    # script/style bodies dropped, empty nodes skipped (like bs4 get_text)
+    tree.strip_tags(["script", "style", "noscript"])
+    scope = tree.css_first("main, [role='main']") or tree.root
+    text = " ".join(s for s in scope.text(separator="\n", strip=True).split("\n") if s)
+    
+    # Bedrooms / area sqft — only when JSON-LD didn't have them; the short og:description
+    # is this listing's own summary, the body text can also carry similar-listing cards
+    if "bedrooms" not in extra:
+        m = RE_BEDROOMS.search(og_desc) or RE_BEDROOMS.search(text)
+        if m:
+            extra["bedrooms"] = int(m.group(1))
+    if "area_sqft" not in extra:
+        m = RE_SQFT.search(og_desc) or RE_SQFT.search(text)
+        if m:
+            extra["area_sqft"] = float(m.group(1).replace(",", ""))
     
     # DLD Zone name (from regulatory info)
-    zone_match = re.search(r"Zone\s*name\s*[:\s]*([A-Za-z][A-Za-z\s\d]+)", text)
+    zone_match = RE_ZONE.search(text)
     if zone_match:
         extra["dld_zone_name"] = zone_match.group(1).strip()
     
     # Reference
-    ref_match = re.search(r"Reference\s*[:\s]*([A-Za-z0-9\-]+)", text)
+    ref_match = RE_REFERENCE.search(text)
     if ref_match:
         extra["reference"] = ref_match.group(1).strip()
     
     # Full address: "Farm Gardens 1, Farm Gardens, The Valley, Dubai"
-    addr_match = re.search(r"([\w\s]+(?:,\s*[\w\s]+){2,3},\s*Dubai)", text)
+    addr_match = RE_ADDRESS.search(text)
     if addr_match:
         extra["full_address"] = addr_match.group(1).strip()
         addr_parts = [p.strip() for p in addr_match.group(1).split(",")]
@@ -366,40 +537,15 @@ def try_scrape_pf(url: str) -> dict:
             extra["community"] = addr_parts[1]
             extra["master_community"] = addr_parts[2]
     
-    # Breadcrumbs
-    crumb_texts = []
-    for link in soup.find_all("a"):
-        href = link.get("href", "")
-        txt = link.get_text(strip=True)
-        if txt and ("for-sale" in href or "for-rent" in href) and len(txt) > 2:
-            if txt not in crumb_texts:
-                crumb_texts.append(txt)
-    if crumb_texts:
-        extra["breadcrumbs"] = crumb_texts
-    
-    # JSON-LD
-    for script in soup.find_all("script", type="application/ld+json"):
-        try:
-            ld = json.loads(script.string)
-            items = ld if isinstance(ld, list) else [ld]
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-                if "numberOfRooms" in item and "bedrooms" not in extra:
-                    extra["bedrooms"] = int(item["numberOfRooms"])
-                if "floorSize" in item and isinstance(item["floorSize"], dict):
-                    val = item["floorSize"].get("value")
-                    if val and "area_sqft" not in extra:
-                        extra["area_sqft"] = float(str(val).replace(",", ""))
-        except:
-            continue
-    
     return extra
 
 
 def get_property_data(url: str) -> dict:
     data = parse_pf_url(url)
-    extra = try_scrape_pf(url)
+    try:
+        extra = try_scrape_pf(url)
+    except ScrapeBlocked:
+        extra = {"_scrape_status": "blocked"}
     for k, v in extra.items():
         if v and (k not in data or not data[k]):
             data[k] = v
@@ -408,6 +554,24 @@ def get_property_data(url: str) -> dict:
 
 # ===================== MATCHING =====================
 
+# Marketing/listing words dropped from page titles before they become a search phrase
+TITLE_STOP_WORDS = frozenset({
+    "for","sale","rent","in","at","a","an","bed","bedroom","bedrooms",
+    "bathroom","bathrooms","with","and","buy","aed","sqft","sq","ft",
+    "br","of","on","by","to","from","dubai","uae","property",
+    "elegant","luxury","luxurious","beautiful","stunning","spacious",
+    "brand","new","modern","exclusive","premium","amazing","gorgeous",
+})
+
+# One-word phrases too generic to search on their own
+GENERIC_SINGLES = frozenset({
+    "gardens","garden","tower","towers","heights","park","view","views",
+    "bay","city","square","hill","hills","lake","lakes","creek","gate",
+    "gates","village","residence","residences","court","place","point",
+    "plaza","walk","boulevard","avenue","street","terrace","estate",
+})
+
+
 def extract_search_phrases(prop: dict) -> list:
     """
     Build search phrases from best available data.
@@ -434,249 +598,358 @@ def extract_search_phrases(prop: dict) -> list:
     # 4. Page title (skip garbage)
     title = prop.get("title") or prop.get("og_title", "")
     if title and "javascript" not in title.lower() and len(title) > 10:
-        stop = {"for","sale","rent","in","at","a","an","bed","bedroom","bedrooms",
-                "bathroom","bathrooms","with","and","buy","aed","sqft","sq","ft",
-                "br","of","on","by","to","from","dubai","uae","property",
-                "elegant","luxury","luxurious","beautiful","stunning","spacious",
-                "brand","new","modern","exclusive","premium","amazing","gorgeous"}
-        words = [w for w in re.split(r"[\s,\-/|]+", title) if w.lower() not in stop and len(w) > 2]
+        words = [w for w in RE_TITLE_SPLIT.split(title) if w.lower() not in TITLE_STOP_WORDS and len(w) > 2]
         if len(words) >= 2:
             phrases.append(" ".join(words))
     
-    # Deduplicate, enforce MIN_LEN, skip generic singles
-    GENERIC_SINGLES = {"gardens","garden","tower","towers","heights","park","view","views",
-                       "bay","city","square","hill","hills","lake","lakes","creek","gate",
-                       "gates","village","residence","residences","court","place","point",
-                       "plaza","walk","boulevard","avenue","street","terrace","estate"}
-    seen = set()
-    unique = []
-    for p in phrases:
-        p_lower = p.strip().lower()
-        if p_lower and p_lower not in seen and len(p_lower) >= MIN_LEN:
-            if " " not in p_lower and p_lower in GENERIC_SINGLES:
-                continue
-            seen.add(p_lower)
-            unique.append(p_lower)
-    
-    return unique
+    # Deduplicate (order kept), enforce MIN_LEN, skip generic singles
+    normalized = (p.strip().lower() for p in phrases)
+    return list(dict.fromkeys(
+        p for p in normalized
+        if len(p) >= MIN_LEN and (" " in p or p not in GENERIC_SINGLES)
+    ))
+
 
+# Fixed statement text, so sqlite3's per-connection statement cache hands back the
+# already-prepared statement instead of re-parsing it on every search
+SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE name = 'units_fts'"
+SQL_FTS_ARM = "SELECT * FROM (SELECT ? AS arm, rowid FROM units_fts WHERE units_fts MATCH ? LIMIT ?)"
+SQL_UNITS_BY_ROWID = "SELECT rowid, * FROM units WHERE rowid IN (SELECT value FROM json_each(?))"
 
-def find_units(conn, prop: dict) -> list:
+# The only columns ranking and dedup read — candidates carry just these (plus rowid)
+# and full rows are fetched for the final top matches only
+RANK_COLUMNS = ("project_name_en", "master_project_en", "area_name_en", "property_type_en",
+                "property_sub_type_en", "rooms", "actual_area", "unit_number", "land_number")
+
+
+def candidate_select(conn) -> str:
+    """SELECT rowid + whichever RANK_COLUMNS this DB has (older builds may lack some)."""
+    present = {r[1] for r in conn.execute("PRAGMA table_info(units)")}
+    return "SELECT " + ", ".join(["rowid"] + [c for c in RANK_COLUMNS if c in present]) + " FROM units"
+
+
+def has_fts(conn) -> bool:
+    """True if the DB ships the units_fts name index (built by convert_csv_to_db.py)."""
+    return conn.execute(SQL_HAS_FTS).fetchone() is not None
+
+
+def _fts_phrase(text: str) -> str:
+    """Quote text as an FTS5 phrase; trailing * prefix-matches the last word (garden → gardens)."""
+    return '"' + text.replace('"', '""') + '"*'
+
+
+def _fts_match(conditions) -> str:
+    """FTS5 query requiring every (column, text) condition: col : "text"* AND ..."""
+    return " AND ".join(f"{col} : {_fts_phrase(text)}" for col, text in conditions)
+
+
+def query_units(conn, select, conditions, limit):
     """
-    Multi-strategy search:
-    0. DLD Zone name → area_name_en (most accurate if available)
-    1. Exact project_name match
-    2. Combined project + master_project match
-    3. Master project match
-    4. Area name fallback
-    5. Individual words (last resort)
+    Candidate rows where every (column, text) condition holds, via col LIKE '%text%'
+    (LIKE is already ASCII case-insensitive, so no per-row LOWER()).
+    Fallback for DBs without units_fts.
+    """
+    if len(conditions) == 1 and len(conditions[0][1]) > 5:
+        # 'text%' is a range search on the COLLATE NOCASE index — if it fills the limit, skip the scan
+        col, text = conditions[0]
+        rows = conn.execute(f"{select} WHERE {col} LIKE ? LIMIT ?", (f"{text}%", limit)).fetchall()
+        if len(rows) >= limit:
+            return rows
+    where = " AND ".join(f"{col} LIKE ?" for col, _ in conditions)
+    params = [f"%{text}%" for _, text in conditions]
+    return conn.execute(f"{select} WHERE {where} LIMIT ?", (*params, limit)).fetchall()
+
+
+def exact_name_phrases(prop: dict, phrases: list) -> list:
+    """
+    Phrases worth an exact project-name lookup, in priority order. URL context
+    phrases (the words before a project candidate, e.g. "the valley") are left out —
+    they name the master community, and an exact hit on one would hide the project.
+    """
+    candidates = prop.get("project_candidates", [])
+    context = {c.get("context", "").lower() for c in candidates} - {c.get("project", "").lower() for c in candidates}
+    return [p for p in phrases if p not in context]
+
+
+def query_exact_project(conn, select, phrases) -> list:
+    """Candidate rows whose project_name_en equals the first phrase that has any (case-insensitive)."""
+    for phrase in phrases:
+        rows = conn.execute(f"{select} WHERE project_name_en = ? COLLATE NOCASE LIMIT 200", (phrase,)).fetchall()
+        if rows:
+            return rows
+    return []
+
+
+def query_arms_fts(conn, arms, indices) -> dict:
+    """
+    Run the given search arms against units_fts in one UNION ALL statement; each
+    arm keeps its own LIMIT and tags its hits with its index. Only rowids come
+    back — no units lookups for arms that end up unused. Returns {arm index: [rowid]}.
+    """
+    hits = {}
+    # Stay well under SQLite's 500-term compound SELECT limit
+    for start in range(0, len(indices), 200):
+        chunk = indices[start:start + 200]
+        sql = " UNION ALL ".join([SQL_FTS_ARM] * len(chunk))
+        params = []
+        for i in chunk:
+            _, conditions, limit = arms[i]
+            params += [i, _fts_match(conditions), limit]
+        for arm, rowid in conn.execute(sql, params):
+            hits.setdefault(arm, []).append(rowid)
+    return hits
+
+
+def fetch_units(conn, select, rowids) -> list:
+    """Candidate rows for the given rowids, in rowid order (one statement for any count)."""
+    return conn.execute(
+        f"{select} WHERE rowid IN (SELECT value FROM json_each(?)) ORDER BY rowid",
+        (orjson.dumps(rowids).decode(),)
+    ).fetchall()
+
+
+def load_matches(conn, ranked) -> list:
+    """Full units rows for ranked (score, candidate) pairs, as dicts with _match_score, best first."""
+    rowids = orjson.dumps([cand["rowid"] for _, cand in ranked]).decode()
+    full = {row["rowid"]: row for row in conn.execute(SQL_UNITS_BY_ROWID, (rowids,))}
+    matches = []
+    for score, cand in ranked:
+        d = dict(full[cand["rowid"]])
+        del d["rowid"]
+        d["_match_score"] = score
+        matches.append(d)
+    return matches
+
+
+# Type/filler words skipped when splitting phrases into AND-ed word searches
+ARM_NOISE_WORDS = frozenset({
+    "the","and","for","villa","apartment","tower","building","residence",
+    "residences","dubai","phase","block","cluster","on","at","in","of",
+})
+
+# Strategy 7 searches one word at a time, so generic name words are noise too
+SINGLE_WORD_NOISE = ARM_NOISE_WORDS | {"gardens","park","heights","square","city","view","bay"}
+
+
+def search_arms(prop: dict, phrases: list):
+    """
+    Every candidate query find_units may need, in priority order, as
+    (strategy, conditions, limit). Strategy numbers follow the find_units ladder.
     """
-    phrases = extract_search_phrases(prop)
-    if not phrases:
-        return []
-    
-    results = []
-    
     # === STRATEGY 0: DLD Zone name → area_name_en (BEST — from regulatory info) ===
     zone = prop.get("dld_zone_name", "")
     community = prop.get("community") or prop.get("sub_community", "")
     if zone and community:
         # Search project within the DLD zone
-        rows = conn.execute(
-            '''SELECT * FROM units 
-               WHERE LOWER(area_name_en) LIKE ? 
-                 AND LOWER(project_name_en) LIKE ?
-               LIMIT 200''',
-            (f"%{zone.lower()}%", f"%{community.lower()}%")
-        ).fetchall()
-        if rows:
-            results.extend(rows)
-    
-    if not results and zone:
+        yield 0, [("area_name_en", zone.lower()), ("project_name_en", community.lower())], 200
+    if zone:
         # Try zone + master community
         master = prop.get("master_community", "")
         if master:
-            rows = conn.execute(
-                '''SELECT * FROM units 
-                   WHERE LOWER(area_name_en) LIKE ? 
-                     AND LOWER(master_project_en) LIKE ?
-                   LIMIT 200''',
-                (f"%{zone.lower()}%", f"%{master.lower()}%")
-            ).fetchall()
-            if rows:
-                results.extend(rows)
-    
+            yield 0, [("area_name_en", zone.lower()), ("master_project_en", master.lower())], 200
+
     # === STRATEGY 1: Direct project_name_en match ===
     # Try each phrase against project_name_en (most specific wins)
     for phrase in phrases:
-        rows = conn.execute(
-            'SELECT * FROM units WHERE LOWER(project_name_en) LIKE ? LIMIT 100',
-            (f"%{phrase}%",)
-        ).fetchall()
-        if rows:
-            results.extend(rows)
-            break
-    
+        yield 1, [("project_name_en", phrase)], 100
+
     # === STRATEGY 2: Combined project + master search ===
     # Split URL location into all possible (master, project) pairs
-    if not results:
-        url_loc = prop.get("url_location", "")
-        if url_loc:
-            parts = url_loc.split()
-            for split_at in range(1, len(parts)):
-                master_candidate = " ".join(parts[:split_at])
-                project_candidate = " ".join(parts[split_at:])
-                if len(project_candidate) > 2 and len(master_candidate) > 2:
-                    rows = conn.execute(
-                        '''SELECT * FROM units 
-                           WHERE LOWER(project_name_en) LIKE ? 
-                             AND LOWER(master_project_en) LIKE ?
-                           LIMIT 100''',
-                        (f"%{project_candidate}%", f"%{master_candidate}%")
-                    ).fetchall()
-                    if rows:
-                        results.extend(rows)
-                        break
-    
+    url_loc = prop.get("url_location", "")
+    parts = url_loc.split()
+    # Every (master words, project words) split of the URL location — strategy 5 walks the same ones
+    splits = [(parts[:split_at], parts[split_at:]) for split_at in range(1, len(parts))]
+    for master_parts, project_parts in splits:
+        master_candidate = " ".join(master_parts)
+        project_candidate = " ".join(project_parts)
+        if len(project_candidate) > 2 and len(master_candidate) > 2:
+            yield 2, [("project_name_en", project_candidate), ("master_project_en", master_candidate)], 100
+
     # === STRATEGY 3: master_project_en match ===
-    if not results:
-        for phrase in phrases:
-            if len(phrase) > 3:  # Skip very short phrases
-                rows = conn.execute(
-                    'SELECT * FROM units WHERE LOWER(master_project_en) LIKE ? LIMIT 200',
-                    (f"%{phrase}%",)
-                ).fetchall()
-                if rows:
-                    results.extend(rows)
-                    break
-    
+    for phrase in phrases:
+        if len(phrase) > 3:  # Skip very short phrases
+            yield 3, [("master_project_en", phrase)], 200
+
     # === STRATEGY 4: area_name_en match ===
-    if not results:
-        for phrase in phrases:
-            if len(phrase) > 3:
-                rows = conn.execute(
-                    'SELECT * FROM units WHERE LOWER(area_name_en) LIKE ? LIMIT 200',
-                    (f"%{phrase}%",)
-                ).fetchall()
-                if rows:
-                    results.extend(rows)
-                    break
-    
+    for phrase in phrases:
+        if len(phrase) > 3:
+            yield 4, [("area_name_en", phrase)], 200
+
     # === STRATEGY 5: Multi-word AND search (smart — handles name variations) ===
     # "farm gardens" failed as exact phrase? Try: project LIKE '%farm%' AND project LIKE '%garden%'
     # This catches "FARM GARDENS 1,2", "The Farm Gardens", etc.
-    if not results:
-        noise = {"the","and","for","villa","apartment","tower","building","residence",
-                 "residences","dubai","phase","block","cluster","on","at","in","of"}
-        url_loc = prop.get("url_location", "")
-        if url_loc:
-            parts = url_loc.split()
-            # Try combining project words + master words with AND
-            for split_at in range(1, len(parts)):
-                master_words = [w for w in parts[:split_at] if w not in noise and len(w) > 2]
-                project_words = [w for w in parts[split_at:] if w not in noise and len(w) > 2]
-                
-                if project_words and master_words:
-                    # Build: project LIKE '%farm%' AND project LIKE '%garden%' AND master LIKE '%valley%'
-                    conditions = []
-                    params = []
-                    for w in project_words:
-                        conditions.append('LOWER(project_name_en) LIKE ?')
-                        params.append(f'%{w}%')
-                    for w in master_words:
-                        conditions.append('LOWER(master_project_en) LIKE ?')
-                        params.append(f'%{w}%')
-                    
-                    sql = f'SELECT * FROM units WHERE {" AND ".join(conditions)} LIMIT 200'
-                    rows = conn.execute(sql, params).fetchall()
-                    if rows:
-                        results.extend(rows)
-                        break
-    
+    # Try combining project words + master words with AND
+    for master_parts, project_parts in splits:
+        master_words = [w for w in master_parts if w not in ARM_NOISE_WORDS and len(w) > 2]
+        project_words = [w for w in project_parts if w not in ARM_NOISE_WORDS and len(w) > 2]
+
+        if project_words and master_words:
+            # Build: project ~ 'farm' AND project ~ 'garden' AND master ~ 'valley'
+            conditions = [("project_name_en", w) for w in project_words]
+            conditions += [("master_project_en", w) for w in master_words]
+            yield 5, conditions, 200
+
     # === STRATEGY 6: Individual project words with AND ===
-    if not results:
-        noise = {"the","and","for","villa","apartment","tower","building","residence",
-                 "residences","dubai","phase","block","cluster","on","at","in","of"}
-        for phrase in phrases:
-            words = [w for w in phrase.split() if w not in noise and len(w) > 3]
-            if len(words) >= 2:
-                conditions = [f'LOWER(project_name_en) LIKE ?' for _ in words]
-                params = [f'%{w}%' for w in words]
-                sql = f'SELECT * FROM units WHERE {" AND ".join(conditions)} LIMIT 200'
-                rows = conn.execute(sql, params).fetchall()
-                if rows:
-                    results.extend(rows)
-                    break
-    
+    for phrase in phrases:
+        words = [w for w in phrase.split() if w not in ARM_NOISE_WORDS and len(w) > 3]
+        if len(words) >= 2:
+            yield 6, [("project_name_en", w) for w in words], 200
+
     # === STRATEGY 7: Single significant words (last resort) ===
-    if not results:
-        noise = {"the","and","for","villa","apartment","tower","building","residence",
-                 "residences","dubai","phase","block","cluster","gardens","park",
-                 "heights","tower","square","city","view","bay","on","at","in","of"}
-        for phrase in phrases:
-            words = [w for w in phrase.split() if w not in noise and len(w) > 4]
-            for word in words:
-                rows = conn.execute(
-                    'SELECT * FROM units WHERE LOWER(project_name_en) LIKE ? LIMIT 100',
-                    (f"%{word}%",)
-                ).fetchall()
-                if rows:
-                    results.extend(rows)
-                    break
-            if results:
-                break
-    
-    return rank_results(results, prop, phrases)[:20]
+    for phrase in phrases:
+        words = [w for w in phrase.split() if w not in SINGLE_WORD_NOISE and len(w) > 4]
+        for word in words:
+            yield 7, [("project_name_en", word)], 100
+
+
+def find_units(conn, prop: dict, phrases: list = None) -> list:
+    """
+    Multi-strategy search:
+    0. DLD Zone name → area_name_en (most accurate if available)
+    1. Exact project_name match
+    2. Combined project + master_project match
+    3. Master project match
+    4. Area name fallback
+    5. Individual words (last resort)
+    Strategy 1 first tries each phrase as an exact project_name_en (URL context
+    phrases like "the valley" excluded), then falls back to substring arms.
+    Within a strategy the first arm with hits wins; strategies 0 and 1 both
+    contribute, later ones only run while nothing has matched yet.
+    With units_fts each strategy's arms go out as one UNION ALL statement; the
+    LIKE fallback runs arms one at a time since each can be a table scan.
+    """
+    if phrases is None:
+        phrases = extract_search_phrases(prop)
+    if not phrases:
+        return []
 
+    fts = has_fts(conn)
+    select = candidate_select(conn)
+    arms = list(search_arms(prop, phrases))
+    hits = {}
+    batched = set()
+    exact_tried = False
 
-def rank_results(rows, prop, search_phrases):
-    """Score and rank results. Higher = better match."""
+    results = []
+    matched = set()
+    for i, (strategy, conditions, limit) in enumerate(arms):
+        if strategy in matched:
+            continue
+        if strategy >= 2 and results:
+            break
+        if strategy == 1 and not exact_tried:
+            # First strategy-1 arm: a phrase that *is* a project name (NOCASE index seek)
+            exact_tried = True
+            rows = query_exact_project(conn, select, exact_name_phrases(prop, phrases))
+            if rows:
+                results.extend(rows)
+                matched.add(1)
+                continue
+        if fts:
+            if strategy not in batched:
+                # One statement per strategy — 0 and 1 always both run, so they share one
+                group = {0, 1} if strategy <= 1 else {strategy}
+                hits.update(query_arms_fts(conn, arms, [j for j, arm in enumerate(arms) if arm[0] in group]))
+                batched |= group
+            rows = fetch_units(conn, select, hits[i]) if i in hits else []
+        else:
+            rows = query_units(conn, select, conditions, limit)
+        if rows:
+            results.extend(rows)
+            matched.add(strategy)
+
+    # Strategies 0 and 1 can return the same unit — drop repeats (first one wins) before scoring
+    if results:
+        cols = results[0].keys()
+        key_idx = [cols.index(c) for c in ("unit_number", "land_number", "project_name_en") if c in cols]
+        unique = {}
+        for row in results:
+            unique.setdefault(tuple(row[i] for i in key_idx), row)
+        results = list(unique.values())
+
+    return load_matches(conn, rank_results(results, prop, phrases))
+
+
+@st.cache_data(persist="disk", max_entries=256, show_spinner=False)
+def cached_find_units(_conn, prop: dict, db_mtime: float, _phrases: list = None) -> list:
+    """
+    find_units memoized per property; db_mtime keys the cache to the current DB file,
+    so entries never go stale and can persist on disk across restarts (no ttl needed).
+    _phrases is derived from prop, so it's passed through without being hashed.
+    """
+    return find_units(_conn, prop, _phrases)
+
+
+# Filler words that don't count toward the area-term bonus
+RANK_STOP_WORDS = frozenset({"the","and","for","of","in","at","a","an","to","by","on","from"})
+
+
+def rank_results(rows, prop, search_phrases, limit=20):
+    """Score and rank results. Higher = better match. Returns the top `limit` as (score, row) pairs."""
     scored = []
+
+    # Score straight off the sqlite3.Row tuples.
+    # Column positions are looked up once — columns missing from this DB read as None.
+    col = {k: i for i, k in enumerate(rows[0].keys())} if rows else {}
+    def field(row, name):
+        i = col.get(name)
+        return None if i is None else row[i]
     
     # Build all search terms for comparison
-    all_terms = set()
-    for p in search_phrases:
-        all_terms.update(p.lower().split())
-    all_terms -= {"the","and","for","of","in","at","a","an","to","by","on","from"}
+    all_terms = {term for p in search_phrases for term in p.lower().split()} - RANK_STOP_WORDS
     
     full_search = " ".join(search_phrases).lower()
     zone = prop.get("dld_zone_name", "").lower() if prop else ""
+
+    # Per-phrase weights and listing fields don't change across rows
+    lead_words = max(len(search_phrases[0].split()), 1)
+    phrase_weights = [(phrase, len(phrase.split()) / lead_words) for phrase in search_phrases]
+    ptype = prop.get("property_type", "").lower()
+    beds = prop.get("bedrooms")
+    sqft = prop.get("area_sqft")
+
+    # Candidates mostly share a handful of project names — score each distinct name once,
+    # all in a single rapidfuzz call
+    names = list({(field(row, "project_name_en") or "").lower() for row in rows} - {""})
+    similarity = {name: sim * 0.3 for name, sim, _ in process.extract(full_search, names, scorer=fuzz.ratio, limit=None)}
+    
+    # Name-column bonuses depend only on the string, and candidates repeat a few
+    # project/master/area names — compute each distinct value once
+    project_scores, master_scores, area_scores = {}, {}, {}
+    # Same for the TEXT rooms/actual_area cells — parse each distinct string once
+    rooms_scores, area_size_scores = {}, {}
     
     for row in rows:
-        d = dict(row)
-        score = 0
-        
-        project = (d.get("project_name_en") or "").lower()
-        master = (d.get("master_project_en") or "").lower()
-        area = (d.get("area_name_en") or "").lower()
+        project = (field(row, "project_name_en") or "").lower()
+        master = (field(row, "master_project_en") or "").lower()
+        area = (field(row, "area_name_en") or "").lower()
         
-        # Exact phrase match in project name (strongest signal)
-        for phrase in search_phrases:
-            if phrase in project:
-                score += 60 * (len(phrase.split()) / max(len(search_phrases[0].split()), 1))
-        
-        # Project name similarity
-        if project:
-            score += SequenceMatcher(None, full_search, project).ratio() * 30
+        if project not in project_scores:
+            # Exact phrase match in project name (strongest signal)
+            s = sum(60 * weight for phrase, weight in phrase_weights if phrase in project)
+            # Project name similarity
+            if project:
+                s += similarity[project]
+            project_scores[project] = s
+        score = project_scores[project]
         
         # Master project match
-        for phrase in search_phrases:
-            if phrase in master:
-                score += 25 * (len(phrase.split()) / max(len(search_phrases[0].split()), 1))
-        
-        # Area match
-        for term in all_terms:
-            if term in area:
-                score += 5
+        if master not in master_scores:
+            master_scores[master] = sum(25 * weight for phrase, weight in phrase_weights if phrase in master)
+        score += master_scores[master]
         
-        # DLD Zone name match (strong signal)
-        if zone and zone in area:
-            score += 20
+        if area not in area_scores:
+            # Area match
+            s = 5 * sum(1 for term in all_terms if term in area)
+            # DLD Zone name match (strong signal)
+            if zone and zone in area:
+                s += 20
+            area_scores[area] = s
+        score += area_scores[area]
         
         # Property type match
-        ptype = prop.get("property_type", "").lower()
-        db_type = (d.get("property_type_en") or "").lower()
-        db_subtype = (d.get("property_sub_type_en") or "").lower()
+        db_type = (field(row, "property_type_en") or "").lower()
+        db_subtype = (field(row, "property_sub_type_en") or "").lower()
         if ptype:
             if ptype in db_type or ptype in db_subtype:
                 score += 15
@@ -684,41 +957,30 @@ def rank_results(rows, prop, search_phrases):
                 score += 15
         
         # Bedroom match
-        beds = prop.get("bedrooms")
-        db_rooms = d.get("rooms")
+        db_rooms = field(row, "rooms")
         if beds is not None and db_rooms:
-            try:
-                if int(beds) == int(float(db_rooms)):
-                    score += 10
-            except:
-                pass
+            if db_rooms not in rooms_scores:
+                try:
+                    rooms_scores[db_rooms] = 10 if int(beds) == int(float(db_rooms)) else 0
+                except:
+                    rooms_scores[db_rooms] = 0
+            score += rooms_scores[db_rooms]
         
         # Area size match (within 15%)
-        sqft = prop.get("area_sqft")
-        db_area = d.get("actual_area")
+        db_area = field(row, "actual_area")
         if sqft and db_area:
-            try:
-                db_sqft = float(db_area) * 10.764
-                if abs(sqft - db_sqft) < sqft * 0.15:
-                    score += 12
-            except:
-                pass
+            if db_area not in area_size_scores:
+                try:
+                    db_sqft = float(db_area) * 10.764
+                    area_size_scores[db_area] = 12 if abs(sqft - db_sqft) < sqft * 0.15 else 0
+                except:
+                    area_size_scores[db_area] = 0
+            score += area_size_scores[db_area]
         
-        d["_match_score"] = round(score, 1)
-        scored.append(d)
+        scored.append((round(score, 1), row))
     
-    scored.sort(key=lambda x: x["_match_score"], reverse=True)
-    
-    # Deduplicate
-    seen = set()
-    unique = []
-    for d in scored:
-        key = (d.get("unit_number"), d.get("land_number"), d.get("project_name_en"))
-        if key not in seen:
-            seen.add(key)
-            unique.append(d)
-    
-    return unique
+    # Only the top `limit` are shown — no need to sort every candidate
+    return heapq.nlargest(limit, scored, key=lambda x: x[0])
 
 
 # ===================== UI =====================
@@ -760,27 +1022,44 @@ DISPLAY_FIELDS = [
     ("creation_date", "📅 Created"),
 ]
 
+# Per-field HTML prefix built once — rendering only splices in the value
+DISPLAY_HTML = [
+    (key, f'<div class="result-item"><span class="result-label">{label}</span><span class="result-value">')
+    for key, label in DISPLAY_FIELDS
+]
+
+# Placeholder cell values that aren't worth a row on the card
+EMPTY_VALUES = frozenset({"", "0", "null", "0.00"})
 
-def render_card(match, i):
+
+def card_html(match, i) -> str:
     score = match.get("_match_score", 0)
     if score > 50: badge = '<span class="match-score match-high">High Match</span>'
     elif score > 25: badge = '<span class="match-score match-medium">Medium Match</span>'
     else: badge = '<span class="match-score match-low">Low Match</span>'
 
     project = match.get("project_name_en") or match.get("project_name_ar") or "Unknown"
-    rows_html = ""
-    for key, label in DISPLAY_FIELDS:
-        val = match.get(key)
-        if val and str(val).strip() and str(val).strip() not in ("0", "null", "0.00"):
-            rows_html += f'<div class="result-item"><span class="result-label">{label}</span><span class="result-value">{val}</span></div>'
+    rows_html = "".join(
+        f"{prefix}{val}</span></div>"
+        for key, prefix in DISPLAY_HTML
+        if (val := match.get(key)) and str(val).strip() not in EMPTY_VALUES
+    )
+
+    return f'<div class="result-card"><h3>#{i} — {project} {badge}</h3>{rows_html}</div>'
+
 
-    st.markdown(f'<div class="result-card"><h3>#{i} — {project} {badge}</h3>{rows_html}</div>', unsafe_allow_html=True)
+def render_cards(matches):
+    """All result cards in one st.markdown — one element/delta instead of one per card."""
+    st.markdown("".join(card_html(m, i) for i, m in enumerate(matches, 1)), unsafe_allow_html=True)
 
 
 def render_sidebar():
     with st.sidebar:
         st.markdown("## ⚙️ Database Status")
-        stats = get_db_stats()
+        stats = None
+        if os.path.exists(DB_PATH):
+            db_stat = os.stat(DB_PATH)
+            stats = get_db_stats(db_stat.st_mtime, db_stat.st_size)
         if stats:
             st.markdown(
                 f'<div class="info-box status-ok">✅ Database loaded<br>'
@@ -796,12 +1075,17 @@ def render_sidebar():
         st.markdown("## 🔄 Manual Update")
         st.caption("Download latest data from GitHub Releases")
         if st.button("🔄 Update Now", use_container_width=True, type="primary"):
-            with st.spinner("📥 Downloading & decompressing..."):
-                ok = download_db_from_github(force=True)
-            if ok:
+            bar = st.progress(0.0, text="📥 Downloading & decompressing...")
+            status = download_db_from_github(
+                force=True, progress=lambda f: bar.progress(f, text=f"📥 Downloading & decompressing... {f:.0%}"))
+            bar.empty()
+            if status == "updated":
+                # New file, new mtime — the mtime-keyed search/stats caches miss on their own; only the connection is stale
                 get_db.clear()
                 st.success("✅ Updated!")
                 st.rerun()
+            elif status == "unchanged":
+                st.info("✅ Already up to date")
             else:
                 st.error("❌ Download failed. Check repo settings.")
 
@@ -841,10 +1125,109 @@ def manual_search(conn, query: str, search_field: str) -> list:
     return [dict(r) for r in rows]
 
 
+@st.fragment
+def url_search_tab(conn):
+    """Property Finder URL lookup — a fragment, so its widgets rerun only this tab."""
+    url = st.text_input("🔗 Paste Property Finder URL", placeholder="https://www.propertyfinder.ae/en/plp/buy/...")
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        btn = st.button("🔍 Find Unit Number", use_container_width=True, type="primary")
+
+    if btn and url:
+        if "propertyfinder" not in url.lower():
+            st.error("❌ Invalid Property Finder URL")
+            return
+
+        if not conn:
+            st.error("❌ No database. Click **🔄 Update Now** in sidebar.")
+            return
+
+        with st.spinner("🔍 Analyzing property link..."):
+            prop = get_property_data(url)
+        if "error" in prop:
+            st.error(f"❌ {prop['error']}")
+            return
+
+        scrape_status = prop.get("_scrape_status", "not attempted")
+        scrape_method = prop.get("_scrape_method", "")
+        scrape_note = ""
+        if scrape_status == "blocked":
+            scrape_note = " *(PF blocked all methods — URL data only)*"
+        elif scrape_status == "failed":
+            scrape_note = " *(using URL data)*"
+        elif scrape_method:
+            scrape_note = f" *(scraped via {scrape_method})*"
+
+        st.markdown(f"### 📋 Property Details{scrape_note}")
+        with st.expander("View", expanded=True):
+            for k, v in {
+                "Type": prop.get("property_type", "—"),
+                "URL Location": prop.get("url_location", "—"),
+                "Title": prop.get("title") or prop.get("og_title", "—"),
+                "Bedrooms": prop.get("bedrooms", "—"),
+                "Area (sqft)": prop.get("area_sqft", "—"),
+                "DLD Zone": prop.get("dld_zone_name", "—"),
+            }.items():
+                if str(v) != "—" and str(v).strip():
+                    st.markdown(f"**{k}:** {v}")
+
+            phrases = extract_search_phrases(prop)
+            if phrases:
+                st.markdown(f"**Search phrases:** {', '.join([f'`{p}`' for p in phrases[:8]])}")
+
+        with st.spinner("🔍 Searching DLD database..."):
+            matches = cached_find_units(conn, prop, os.path.getmtime(DB_PATH), phrases)
+
+        if matches:
+            st.markdown(f"### ✅ {len(matches)} match{'es' if len(matches) > 1 else ''}")
+            st.markdown('<div class="info-box">💡 Top result = most likely. All 46 DLD columns shown.</div>', unsafe_allow_html=True)
+            render_cards(matches[:10])
+        else:
+            st.warning("⚠️ No matches found. Try **Manual Search** tab — search by project name directly.")
+
+
+@st.fragment
+def manual_search_tab(conn):
+    """Direct DB search — a fragment, so its widgets rerun only this tab."""
+    st.markdown("Search the DLD database directly by project name, area, unit number, etc.")
+
+    col_a, col_b = st.columns([3, 1])
+    with col_a:
+        query = st.text_input("🔍 Search term", placeholder="e.g. Farm Gardens, Greenway, Emaar South...")
+    with col_b:
+        field = st.selectbox("Search in", [
+            "Project Name", "Master Project", "Area Name",
+            "Unit Number", "Building", "Property ID"
+        ])
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        btn2 = st.button("🔍 Search DLD", use_container_width=True, type="primary", key="manual_search")
+
+    if btn2 and query:
+        if not conn:
+            st.error("❌ No database. Click **🔄 Update Now** in sidebar.")
+            return
+
+        with st.spinner("🔍 Searching..."):
+            results = manual_search(conn, query, field)
+
+        if results:
+            st.markdown(f"### ✅ {len(results)} result{'s' if len(results) > 1 else ''} for `{query}` in {field}")
+            for m in results[:20]:
+                m["_match_score"] = 100  # manual search = high confidence
+            render_cards(results[:20])
+        else:
+            st.warning(f"⚠️ No results for `{query}` in {field}. Try a different search term or field.")
+
+
 def main():
     if not os.path.exists(DB_PATH):
-        with st.spinner("📥 First load — downloading database..."):
-            download_db_from_github(force=True)
+        bar = st.progress(0.0, text="📥 First load — downloading database...")
+        download_db_from_github(
+            force=True, progress=lambda f: bar.progress(f, text=f"📥 First load — downloading database... {f:.0%}"))
+        bar.empty()
 
     render_sidebar()
 
@@ -857,97 +1240,11 @@ def main():
     
     # ============= TAB 1: URL SEARCH =============
     with tab1:
-        url = st.text_input("🔗 Paste Property Finder URL", placeholder="https://www.propertyfinder.ae/en/plp/buy/...")
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            btn = st.button("🔍 Find Unit Number", use_container_width=True, type="primary")
-
-        if btn and url:
-            if "propertyfinder" not in url.lower():
-                st.error("❌ Invalid Property Finder URL")
-                return
-
-            if not conn:
-                st.error("❌ No database. Click **🔄 Update Now** in sidebar.")
-                return
-
-            with st.spinner("🔍 Analyzing property link..."):
-                prop = get_property_data(url)
-            if "error" in prop:
-                st.error(f"❌ {prop['error']}")
-                return
-            
-            scrape_status = prop.get("_scrape_status", "not attempted")
-            scrape_method = prop.get("_scrape_method", "")
-            scrape_note = ""
-            if scrape_status == "blocked":
-                scrape_note = " *(PF blocked all methods — URL data only)*"
-            elif scrape_status == "failed":
-                scrape_note = " *(using URL data)*"
-            elif scrape_method:
-                scrape_note = f" *(scraped via {scrape_method})*"
-
-            st.markdown(f"### 📋 Property Details{scrape_note}")
-            with st.expander("View", expanded=True):
-                for k, v in {
-                    "Type": prop.get("property_type", "—"),
-                    "URL Location": prop.get("url_location", "—"),
-                    "Title": prop.get("title") or prop.get("og_title", "—"),
-                    "Bedrooms": prop.get("bedrooms", "—"),
-                    "Area (sqft)": prop.get("area_sqft", "—"),
-                    "DLD Zone": prop.get("dld_zone_name", "—"),
-                }.items():
-                    if str(v) != "—" and str(v).strip():
-                        st.markdown(f"**{k}:** {v}")
-                
-                phrases = extract_search_phrases(prop)
-                if phrases:
-                    st.markdown(f"**Search phrases:** {', '.join([f'`{p}`' for p in phrases[:8]])}")
-
-            with st.spinner("🔍 Searching DLD database..."):
-                matches = find_units(conn, prop)
-
-            if matches:
-                st.markdown(f"### ✅ {len(matches)} match{'es' if len(matches) > 1 else ''}")
-                st.markdown('<div class="info-box">💡 Top result = most likely. All 46 DLD columns shown.</div>', unsafe_allow_html=True)
-                for i, m in enumerate(matches[:10], 1):
-                    render_card(m, i)
-            else:
-                st.warning("⚠️ No matches found. Try **Manual Search** tab — search by project name directly.")
+        url_search_tab(conn)
 
     # ============= TAB 2: MANUAL SEARCH =============
     with tab2:
-        st.markdown("Search the DLD database directly by project name, area, unit number, etc.")
-        
-        col_a, col_b = st.columns([3, 1])
-        with col_a:
-            query = st.text_input("🔍 Search term", placeholder="e.g. Farm Gardens, Greenway, Emaar South...")
-        with col_b:
-            field = st.selectbox("Search in", [
-                "Project Name", "Master Project", "Area Name",
-                "Unit Number", "Building", "Property ID"
-            ])
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            btn2 = st.button("🔍 Search DLD", use_container_width=True, type="primary", key="manual_search")
-        
-        if btn2 and query:
-            if not conn:
-                st.error("❌ No database. Click **🔄 Update Now** in sidebar.")
-                return
-            
-            with st.spinner("🔍 Searching..."):
-                results = manual_search(conn, query, field)
-            
-            if results:
-                st.markdown(f"### ✅ {len(results)} result{'s' if len(results) > 1 else ''} for `{query}` in {field}")
-                for i, m in enumerate(results[:20], 1):
-                    m["_match_score"] = 100  # manual search = high confidence
-                    render_card(m, i)
-            else:
-                st.warning(f"⚠️ No results for `{query}` in {field}. Try a different search term or field.")
+        manual_search_tab(conn)
 
     st.markdown("---")
     st.markdown('<p style="text-align:center;color:#888;font-size:0.8rem;">DLD Open Data • 46 columns preserved • Personal use</p>', unsafe_allow_html=True)
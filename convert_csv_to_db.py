@@ -3,12 +3,14 @@ Convert DLD Units CSV to SQLite database — ZERO DATA LOSS.
 Reads ALL columns dynamically from the CSV header. Nothing is filtered or dropped.
 
 Usage:
-    python convert_csv_to_db.py                    # Download CSV from Dubai Pulse + convert
+    python convert_csv_to_db.py                    # Stream CSV from Dubai Pulse + convert
     python convert_csv_to_db.py --csv units.csv    # Use local CSV file
     python convert_csv_to_db.py --verify           # Verify existing DB
 """
 
 import csv
+import io
+import itertools
 import sqlite3
 import os
 import sys
@@ -17,6 +19,7 @@ import requests
 import time
 import json
 import re
+from collections import defaultdict
 
 CSV_URL = (
     "https://www.dubaipulse.gov.ae/dataset/"
@@ -24,7 +27,6 @@ CSV_URL = (
     "7d4deadf-c9bc-47a4-85de-998d0ce38bf3/download/units.csv"
 )
 DB_PATH = "dld_units.db"
-CSV_RAW = "units_raw.csv"
 METADATA_PATH = "db_metadata.json"
 
 INDEX_COLUMNS = [
@@ -35,66 +37,59 @@ INDEX_COLUMNS = [
     "is_free_hold", "project_name_ar", "area_name_ar", "master_project_ar",
 ]
 
+# Any run of non-alphanumerics (underscores included) collapses to one "_" in a column name
+RE_NON_ALNUM = re.compile(r"[^a-zA-Z0-9]+")
 
-def download_csv(output_path=CSV_RAW):
+# Name columns served by the units_fts full-text index (app search uses MATCH instead of LIKE '%x%')
+FTS_COLUMNS = ["project_name_en", "master_project_en", "area_name_en"]
+
+
+def open_csv_stream():
+    """Open the Dubai Pulse CSV as a text stream — rows are parsed as they arrive, nothing is written to disk."""
     print("=" * 60)
-    print("📥 STEP 1: Downloading CSV from Dubai Pulse")
+    print("📥 STEP 1: Streaming CSV from Dubai Pulse")
     print("=" * 60)
     print(f"   URL: {CSV_URL}")
-    print(f"   ⚠️  File is ~830MB — may take a few minutes...\n")
+    print(f"   ⚠️  File is ~830MB — download and conversion run together...\n")
 
-    start = time.time()
     response = requests.get(CSV_URL, stream=True, timeout=600)
     response.raise_for_status()
-
-    total_size = int(response.headers.get("content-length", 0))
-    downloaded = 0
-
-    with open(output_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=1024 * 1024):
-            f.write(chunk)
-            downloaded += len(chunk)
-            if total_size:
-                pct = (downloaded / total_size) * 100
-                mb_done = downloaded / (1024 * 1024)
-                mb_total = total_size / (1024 * 1024)
-                print(f"\r   ↓ {mb_done:.0f} / {mb_total:.0f} MB ({pct:.1f}%)", end="", flush=True)
-
-    elapsed = time.time() - start
-    file_mb = os.path.getsize(output_path) / (1024 * 1024)
-    print(f"\n   ✅ Downloaded {file_mb:.1f} MB in {elapsed:.0f}s\n")
-    return output_path
+    response.raw.decode_content = True
+    response.raw.auto_close = False  # let TextIOWrapper see EOF instead of a closed file
+    # newline="" — csv.reader handles line endings itself, so a \r\n inside a quoted field survives
+    return response, io.TextIOWrapper(response.raw, encoding="utf-8-sig", newline="")
 
 
 def sanitize_column_name(name):
-    safe = re.sub(r"[^a-zA-Z0-9_]", "_", name.strip())
-    safe = re.sub(r"_+", "_", safe).strip("_").lower()
+    safe = RE_NON_ALNUM.sub("_", name.strip()).strip("_").lower()
     return safe if safe else "col_unknown"
 
 
-def convert_csv_to_sqlite(csv_path, db_path=DB_PATH):
+def _remove_db_files(path):
+    for p in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def convert_csv_to_sqlite(csv_file, db_path=DB_PATH, source=CSV_URL):
+    """Convert an open CSV text stream (local file or HTTP download) in a single pass."""
     print("=" * 60)
     print("🔄 STEP 2: Converting CSV → SQLite (FULL — zero data loss)")
     print("=" * 60)
-    print(f"   Input:  {csv_path} ({os.path.getsize(csv_path) / (1024*1024):.1f} MB)")
+    print(f"   Input:  {source}")
     print(f"   Output: {db_path}\n")
 
+    csv.field_size_limit(sys.maxsize)
+    reader = csv.reader(csv_file)
+
     # Detect columns
-    with open(csv_path, "r", encoding="utf-8-sig") as f:
-        raw_columns = [col.strip() for col in next(csv.reader(f))]
+    raw_columns = [col.strip() for col in next(reader)]
 
     safe_columns = [sanitize_column_name(c) for c in raw_columns]
 
-    # Handle duplicates
-    seen = {}
-    unique_columns = []
-    for col in safe_columns:
-        if col in seen:
-            seen[col] += 1
-            unique_columns.append(f"{col}_{seen[col]}")
-        else:
-            seen[col] = 0
-            unique_columns.append(col)
+    # Handle duplicates — the nth repeat of a name becomes name_n
+    counters = defaultdict(itertools.count)
+    unique_columns = [col if (n := next(counters[col])) == 0 else f"{col}_{n}" for col in safe_columns]
 
     print(f"   📊 Detected {len(unique_columns)} columns:")
     for i, (raw, safe) in enumerate(zip(raw_columns, unique_columns)):
@@ -102,58 +97,66 @@ def convert_csv_to_sqlite(csv_path, db_path=DB_PATH):
         print(f"      {i+1:2d}. {raw.strip()}{marker}")
     print()
 
-    # Create DB
-    if os.path.exists(db_path):
-        os.remove(db_path)
-
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode = WAL")
-    conn.execute("PRAGMA synchronous = NORMAL")
-    conn.execute("PRAGMA cache_size = -64000")
-    cursor = conn.cursor()
-
-    # NO PRIMARY KEY — CSV has duplicate property_ids
-    col_defs = [f'"{col}" TEXT' for col in unique_columns]
-    cursor.execute(f'CREATE TABLE units (\n  {", ".join(col_defs)}\n)')
-
-    # Insert ALL rows
-    start = time.time()
-    total_rows = 0
-    error_rows = 0
-    empty_rows = 0
-
-    placeholders = ", ".join(["?" for _ in unique_columns])
-    col_list = ", ".join([f'"{c}"' for c in unique_columns])
-    insert_sql = f"INSERT INTO units ({col_list}) VALUES ({placeholders})"
-
-    csv.field_size_limit(sys.maxsize)
-
-    with open(csv_path, "r", encoding="utf-8-sig") as f:
-        reader = csv.reader(f)
-        next(reader)  # skip header
-
+    # Build into a side file — the previous DB stays in place until the new one is complete,
+    # so a dropped download mid-stream can't leave a half-written DB behind
+    tmp_path = db_path + ".tmp"
+    _remove_db_files(tmp_path)
+
+    conn = sqlite3.connect(tmp_path, isolation_level=None)  # explicit BEGIN/COMMIT below
+    try:
+        # Bulk-load settings — the DB is rebuilt from scratch, so a crash just means re-running;
+        # no rollback journal or fsyncs while inserting. WAL/NORMAL is restored before indexing.
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA mmap_size = 1073741824")
+        conn.execute("PRAGMA cache_size = -262144")
+        cursor = conn.cursor()
+
+        # NO PRIMARY KEY — CSV has duplicate property_ids
+        col_defs = [f'"{col}" TEXT' for col in unique_columns]
+        cursor.execute(f'CREATE TABLE units (\n  {", ".join(col_defs)}\n)')
+
+        # Insert ALL rows
+        start = time.time()
+        total_rows = 0
+        error_rows = 0
+        empty_rows = 0
+
+        placeholders = ", ".join(["?" for _ in unique_columns])
+        col_list = ", ".join([f'"{c}"' for c in unique_columns])
+        insert_sql = f"INSERT INTO units ({col_list}) VALUES ({placeholders})"
+
+        # One transaction for the whole load — batches bound memory, not commits
+        cursor.execute("BEGIN")
         batch = []
+        last_print = 0.0
+        ncols = len(unique_columns)
+        strip = str.strip
         for line_num, row in enumerate(reader, start=2):
             try:
-                if len(row) < len(unique_columns):
-                    row.extend([""] * (len(unique_columns) - len(row)))
-                elif len(row) > len(unique_columns):
-                    row = row[:len(unique_columns)]
+                if len(row) < ncols:
+                    row.extend([""] * (ncols - len(row)))
+                elif len(row) > ncols:
+                    row = row[:ncols]
 
-                if all(cell.strip() == "" for cell in row):
+                cells = tuple(map(strip, row))
+                if not any(cells):
                     empty_rows += 1
                     continue
 
-                batch.append(tuple(cell.strip() if cell else "" for cell in row))
+                batch.append(cells)
                 total_rows += 1
 
                 if len(batch) >= 25000:
                     cursor.executemany(insert_sql, batch)
-                    conn.commit()
                     batch = []
-                    elapsed = time.time() - start
-                    rate = total_rows / elapsed if elapsed > 0 else 0
-                    print(f"\r   ⏳ {total_rows:>10,} rows ({rate:,.0f}/sec) Errors:{error_rows} Empty:{empty_rows}", end="", flush=True)
+                    now = time.time()
+                    if now - last_print >= 1.0:  # at most one progress line per second
+                        last_print = now
+                        rate = total_rows / (now - start) if now > start else 0
+                        print(f"\r   ⏳ {total_rows:>10,} rows ({rate:,.0f}/sec) Errors:{error_rows} Empty:{empty_rows}", end="", flush=True)
             except Exception as e:
                 error_rows += 1
                 if error_rows <= 10:
@@ -161,28 +164,51 @@ def convert_csv_to_sqlite(csv_path, db_path=DB_PATH):
 
         if batch:
             cursor.executemany(insert_sql, batch)
-            conn.commit()
-
-    # Create indexes
-    print(f"\n\n   📊 Creating indexes...")
-    actual_indexes = []
-    for col in INDEX_COLUMNS:
-        if col in unique_columns:
-            idx = f"idx_{col}"
-            try:
-                collate = " COLLATE NOCASE" if col.endswith(("_en", "_ar")) else ""
-                cursor.execute(f'CREATE INDEX IF NOT EXISTS "{idx}" ON units("{col}"{collate})')
-                actual_indexes.append(col)
-                print(f"      ✓ {idx}")
-            except Exception as e:
-                print(f"      ✗ {idx}: {e}")
-
-    print("\n   🧹 ANALYZE + VACUUM...")
-    cursor.execute("ANALYZE")
-    conn.commit()
-    cursor.execute("VACUUM")
-    conn.commit()
+        csv_size = csv_file.buffer.tell()  # bytes consumed — file size, or bytes off the wire
+
+        # Stored row count — the app reads this instead of a full-table COUNT(*)
+        cursor.execute("CREATE TABLE db_meta (key TEXT PRIMARY KEY, value TEXT)")
+        cursor.execute("INSERT INTO db_meta VALUES ('row_count', ?)", (str(total_rows),))
+        cursor.execute("COMMIT")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+
+        # Create indexes
+        print(f"\n\n   📊 Creating indexes...")
+        actual_indexes = []
+        for col in INDEX_COLUMNS:
+            if col in unique_columns:
+                idx = f"idx_{col}"
+                try:
+                    # NOCASE only folds ASCII — Arabic names get plain BINARY (memcmp) indexes
+                    collate = " COLLATE NOCASE" if col.endswith("_en") else ""
+                    cursor.execute(f'CREATE INDEX IF NOT EXISTS "{idx}" ON units("{col}"{collate})')
+                    actual_indexes.append(col)
+                    print(f"      ✓ {idx}")
+                except Exception as e:
+                    print(f"      ✗ {idx}: {e}")
+
+        # No VACUUM — the file is freshly built and never had a row deleted, so there's nothing to reclaim
+        print("\n   🧹 ANALYZE...")
+        cursor.execute("PRAGMA analysis_limit = 1000")  # sample ~1000 rows per index — enough for the app's equality/prefix lookups
+        cursor.execute("ANALYZE")
+
+        # FTS5 last — it indexes units by implicit rowid, which a VACUUM (if ever added back) could renumber
+        fts_columns = [c for c in FTS_COLUMNS if c in unique_columns]
+        if fts_columns:
+            print("   🔎 Building FTS5 name index...")
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE units_fts USING fts5({", ".join(fts_columns)}, '
+                f"content='units', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute("INSERT INTO units_fts(units_fts) VALUES('rebuild')")
+            print(f"      ✓ units_fts ({', '.join(fts_columns)})")
+    except BaseException:
+        conn.close()
+        _remove_db_files(tmp_path)
+        raise
     conn.close()
+    os.replace(tmp_path, db_path)
 
     elapsed = time.time() - start
     db_size = os.path.getsize(db_path) / (1024 * 1024)
@@ -200,14 +226,17 @@ def convert_csv_to_sqlite(csv_path, db_path=DB_PATH):
 
     metadata = {
         "source_url": CSV_URL,
-        "csv_size_mb": round(os.path.getsize(csv_path) / (1024 * 1024), 1),
+        "csv_size_mb": round(csv_size / (1024 * 1024), 1),
         "db_size_mb": round(db_size, 1),
+        "db_path": os.path.abspath(db_path),
+        "db_size_bytes": os.path.getsize(db_path),
         "columns": unique_columns,
         "column_count": len(unique_columns),
         "total_rows": total_rows,
         "empty_rows_skipped": empty_rows,
         "error_rows": error_rows,
         "indexes": actual_indexes,
+        "fts_columns": fts_columns,
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
     }
     with open(METADATA_PATH, "w") as f:
@@ -217,7 +246,7 @@ def convert_csv_to_sqlite(csv_path, db_path=DB_PATH):
     return db_path, metadata
 
 
-def verify_db(db_path=DB_PATH, csv_path=None):
+def verify_db(db_path=DB_PATH, metadata=None):
     print("\n" + "=" * 60)
     print("🔍 VERIFICATION")
     print("=" * 60)
@@ -249,18 +278,23 @@ def verify_db(db_path=DB_PATH, csv_path=None):
             if v and str(v).strip():
                 print(f"      {c}: {v}")
 
-    if csv_path and os.path.exists(csv_path):
+    # CSV counts were taken while converting — no second pass over the CSV
+    if metadata is None and os.path.exists(METADATA_PATH):
+        with open(METADATA_PATH) as f:
+            metadata = json.load(f)
+        # Only trust the file if it describes this exact DB — not another build's counts
+        if (metadata.get("db_path") != os.path.abspath(db_path)
+                or metadata.get("db_size_bytes") != os.path.getsize(db_path)):
+            metadata = None
+    if not metadata:
+        print(f"\n   ℹ️  No conversion metadata for {db_path} — skipping CSV comparison")
+    else:
         print(f"\n   📊 CSV comparison...")
-        csv_rows = 0
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.reader(f)
-            csv_header = next(reader)
-            for row in reader:
-                if any(cell.strip() for cell in row):
-                    csv_rows += 1
-        print(f"      CSV: {csv_rows:,} rows × {len(csv_header)} cols")
+        csv_rows = metadata["total_rows"]
+        csv_cols = metadata["column_count"]
+        print(f"      CSV: {csv_rows:,} rows × {csv_cols} cols")
         print(f"      DB:  {db_rows:,} rows × {len(db_cols)} cols")
-        if csv_rows == db_rows and len(csv_header) == len(db_cols):
+        if csv_rows == db_rows and csv_cols == len(db_cols):
             print(f"      ✅ PERFECT MATCH!")
         else:
             print(f"      ⚠️  DIFFERENCE: {abs(csv_rows - db_rows):,} rows")
@@ -287,17 +321,17 @@ def main():
         verify_db(args.db)
         return
 
-    csv_path = args.csv if args.csv else download_csv()
-    if args.csv and not os.path.exists(csv_path):
-        print(f"❌ File not found: {csv_path}")
-        sys.exit(1)
-
-    db_path, metadata = convert_csv_to_sqlite(csv_path, args.db)
-    verify_db(db_path, csv_path)
-
-    if not args.csv and os.path.exists(CSV_RAW):
-        print(f"\n🧹 Removing raw CSV...")
-        os.remove(CSV_RAW)
+    if args.csv:
+        if not os.path.exists(args.csv):
+            print(f"❌ File not found: {args.csv}")
+            sys.exit(1)
+        with open(args.csv, "r", encoding="utf-8-sig", newline="") as f:
+            db_path, metadata = convert_csv_to_sqlite(f, args.db, source=args.csv)
+    else:
+        response, f = open_csv_stream()
+        with response, f:
+            db_path, metadata = convert_csv_to_sqlite(f, args.db)
+    verify_db(db_path, metadata)
 
     print(f"\n🎉 DONE! {db_path} ({metadata['db_size_mb']} MB, {metadata['total_rows']:,} rows, {metadata['column_count']} cols)")
 